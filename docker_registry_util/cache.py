@@ -1,11 +1,25 @@
 import json
+import sys
 from collections import defaultdict
-import itertools
+from itertools import chain, repeat
 from operator import itemgetter
 
 from .digest import ContentDigest
 
-DUMP_KWARGS = {'ensure_ascii': False, 'check_circular': False}
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _encode_digest(obj):
+    if isinstance(obj, ContentDigest):
+        return obj.as_sha256()
+    raise TypeError("Object of type {0} is not JSON serializable.".format(type(obj).__name__))
+
+
+# Digests are converted on demand by the encoder, so that the cache is serialized without an intermediate copy.
+DUMP_KWARGS = {'ensure_ascii': False, 'check_circular': False, 'separators': (',', ':'), 'default': _encode_digest}
 
 _get_first = itemgetter(0)
 
@@ -25,10 +39,11 @@ class ImageDigestCache(object):
 
     def _discard_digest_tag(self, digest, repo, tag):
         tags = self._digest_tags.get(digest)
-        if tags is not None:
-            tags.discard((repo, tag))
-            if not tags:
-                del self._digest_tags[digest]
+        if tags is None:
+            return
+        tags.discard((repo, tag))
+        if not tags:
+            self._digest_tags.pop(digest, None)
 
     def add_image(self, repo, tag, digest):
         """
@@ -42,6 +57,7 @@ class ImageDigestCache(object):
         :param digest: Image digest.
         :type digest: bytes
         """
+        repo = sys.intern(repo)
         self._tag_digests[repo][tag] = digest
         self._digest_tags[digest].add((repo, tag))
 
@@ -56,17 +72,19 @@ class ImageDigestCache(object):
         :type tag: str
         :param digest: Image digest.
         :type digest: bytes
+        :return: ``True`` if the cache was changed, ``False`` if the image was already registered with the digest.
+        :rtype: bool
         """
-        existing_tags = self._tag_digests.get(repo)
-        if not existing_tags:
-            self.add_image(repo, tag, digest)
+        repo = sys.intern(repo)
+        existing_tags = self._tag_digests[repo]
         existing_digest = existing_tags.get(tag)
-        if existing_digest:
-            if existing_digest == digest:
-                return False
+        if existing_digest == digest:
+            return False
+        if existing_digest is not None:
             self._discard_digest_tag(existing_digest, repo, tag)
-            self._digest_tags[digest].add((repo, tag))
-            existing_tags[tag] = digest
+        existing_tags[tag] = digest
+        self._digest_tags[digest].add((repo, tag))
+        return True
 
     def remove_repository(self, name):
         """
@@ -78,17 +96,11 @@ class ImageDigestCache(object):
         :return: ``True`` if there was anything to remove, ``False`` otherwise.
         :rtype: bool
         """
-        existing_rd = self._tag_digests.get(name)
+        existing_rd = self._tag_digests.pop(name, None)
         if not existing_rd:
             return False
-        existing_digests = set(existing_rd.values())
-        for digest in existing_digests:
-            existing_tags = self._digest_tags.get(digest)
-            repo_tags = {i for i in existing_tags if i[0] == name}
-            existing_tags.difference_update(repo_tags)
-            if not existing_tags:
-                del self._digest_tags[digest]
-        del self._tag_digests[name]
+        for tag, digest in existing_rd.items():
+            self._discard_digest_tag(digest, name, tag)
         return True
 
     def remove_tag(self, repo, tag):
@@ -122,15 +134,20 @@ class ImageDigestCache(object):
         :param digests: List of digests.
         :type digests: list[bytes]
         """
-        all_tags = itertools.chain.from_iterable((self._digest_tags.get(digest) for digest in digests))
-        for repo, repo_tags in itertools.groupby(sorted(all_tags, key=_get_first), _get_first):
+        repo_tags = defaultdict(list)
+        for digest in digests:
+            tags = self._digest_tags.get(digest)
+            if tags:
+                for repo, tag in tags:
+                    repo_tags[repo].append(tag)
+        for repo, tag_list in repo_tags.items():
             repo_digests = self._tag_digests[repo]
-            for rt in repo_tags:
-                del repo_digests[rt[1]]
+            for tag in tag_list:
+                repo_digests.pop(tag, None)
             if not repo_digests:
                 del self._tag_digests[repo]
         for digest in digests:
-            del self._digest_tags[digest]
+            self._digest_tags.pop(digest, None)
 
     def reset(self):
         """
@@ -150,10 +167,12 @@ class ImageDigestCache(object):
         :return: Set of content digests.
         :rtype: set[docker_registry_query.digest.ContentDigest]
         """
+        repo_digests = self._tag_digests.get(repo)
+        if repo_digests is None:
+            return set()
         if tags is not None:
-            return set(filter(None, (self._tag_digests.get(repo, {}).get(tag)
-                                     for tag in tags)))
-        return set(self._tag_digests.get(repo, {}).values())
+            return set(filter(None, map(repo_digests.get, tags)))
+        return set(repo_digests.values())
 
     def get_tag_digests(self, repo):
         """
@@ -177,7 +196,7 @@ class ImageDigestCache(object):
         :return: Repository names.
         :rtype: set[str]
         """
-        return set(rt[0] for rt in self._digest_tags.get(digest, []))
+        return {repo for repo, _ in self._digest_tags.get(digest, ())}
 
     def get_digest_tags(self, digest):
         """
@@ -194,15 +213,18 @@ class ImageDigestCache(object):
 
     def get_grouped_tags(self, digest):
         """
-        Same as ``get_digest_tags``, but returns a group iterator by repository name.
+        Same as ``get_digest_tags``, but returns the tags grouped by repository name. The groups are in no particular
+        order.
 
         :param digest: Image digest.
         :type digest: bytes
-        :return: A groupby object for iterating over repositories and tags.
-        :rtype: itertools.groupby
+        :return: Tuples of repository names and lists of the associated tags.
+        :rtype: collections.Iterable[(str, list[str])]
         """
-        tags = self._digest_tags.get(digest, ())
-        return itertools.groupby(sorted(tags, key=_get_first), _get_first)
+        groups = defaultdict(list)
+        for repo, tag in self._digest_tags.get(digest, ()):
+            groups[repo].append(tag)
+        return groups.items()
 
     def get_repo_names(self):
         """
@@ -213,6 +235,19 @@ class ImageDigestCache(object):
         """
         return sorted(self._tag_digests.keys())
 
+    def iter_repo_names(self, sort=True):
+        """
+        Returns an iterator over available repository names, for callers that do not need a list.
+
+        :param sort: Whether to return the names in sorted order. Otherwise they are returned in no particular order.
+        :type sort: bool
+        :return: Repository name iterator.
+        :rtype: collections.Iterator[str]
+        """
+        if sort:
+            return iter(sorted(self._tag_digests))
+        return iter(self._tag_digests)
+
     def get_tag_names(self, repos=None, tag_sort_key=None, reverse_sort=False):
         """
         Returns a sorted list of available tags, optionally filtered by a set of repository names.
@@ -226,44 +261,42 @@ class ImageDigestCache(object):
         :rtype: list[(str, str)]
         """
         if repos:
-            return [(repo, tag)
-                    for repo in repos
-                    for tag in sorted(self._tag_digests[repo].keys(), key=tag_sort_key, reverse=reverse_sort)]
-        return [(repo, tag)
-                for repo, tag_repos in sorted(self._tag_digests.items(), key=_get_first)
-                for tag in sorted(tag_repos.keys(), key=tag_sort_key, reverse=reverse_sort)]
+            repo_tags = ((repo, self._tag_digests[repo]) for repo in repos)
+        else:
+            repo_tags = sorted(self._tag_digests.items(), key=_get_first)
+        return list(chain.from_iterable(zip(repeat(repo), sorted(tags, key=tag_sort_key, reverse=reverse_sort))
+                                        for repo, tags in repo_tags))
 
     @classmethod
     def _load(cls, tag_digests):
         if not isinstance(tag_digests, dict):
             raise ValueError("Unexpected object type.", type(tag_digests).__name__)
         new_instance = cls()
-        new_instance._tag_digests.update({repo: {tag: ContentDigest.from_sha256(digest)
-                                                 for tag, digest in tags.items()}
-                                          for repo, tags in tag_digests.items()})
+        all_tag_digests = new_instance._tag_digests
         digest_tags = new_instance._digest_tags
+        from_sha256 = ContentDigest.from_sha256
         for repo, tags in tag_digests.items():
-            for tag, digest in tags.items():
-                digest_tags[ContentDigest.from_sha256(digest)].add((repo, tag))
+            # Repository names are repeated in every tuple of the digest index; JSON decoding however returns a
+            # separate string object for each occurrence.
+            repo = sys.intern(repo)
+            repo_digests = all_tag_digests[repo]
+            for tag, digest_str in tags.items():
+                digest = from_sha256(digest_str)
+                repo_digests[tag] = digest
+                digest_tags[digest].add((repo, tag))
         return new_instance
 
-    def _serialize(self):
-        return {repo: {tag: digest.as_sha256()
-                       for tag, digest in tags.items()}
-                for repo, tags in self._tag_digests.items()}
-
     @classmethod
     def load(cls, file):
         """
         Creates a new cache instance from the given file-like object, containing the JSON-encoded contents of the
         registry information.
 
-        :param file: File object.
+        :param file: File object, opened in text or binary mode.
         :return: New ImageCache instance.
         :rtype: ImageDigestCache
         """
-        tag_digests = json.load(file)
-        return cls._load(tag_digests)
+        return cls.loads(file.read())
 
     @classmethod
     def loads(cls, s):
@@ -271,20 +304,30 @@ class ImageDigestCache(object):
         Creates a new cache instance from the given string, containing the JSON-encoded contents of the registry
         information.
 
-        :param s: JSON-encoded string.
+        :param s: JSON-encoded string or bytes.
+        :type s: str | bytes
         :return: New ImageCache instance.
         :rtype: ImageDigestCache
         """
-        tag_digests = json.loads(s)
+        if orjson is None:
+            if isinstance(s, bytes):
+                # Python versions before 3.6 only decode str.
+                s = s.decode('utf-8')
+            tag_digests = json.loads(s)
+        else:
+            tag_digests = orjson.loads(s)
         return cls._load(tag_digests)
 
     def dump(self, file):
         """
         Stores the current state of the cache in the given file-like stream as a JSON object.
 
-        :param file: File object.
+        :param file: File object, opened in text mode. For binary files, write the output of ``dumpb`` instead.
         """
-        json.dump(self._serialize(), file,  **DUMP_KWARGS)
+        if orjson is None:
+            json.dump(self._tag_digests, file, **DUMP_KWARGS)
+        else:
+            file.write(orjson.dumps(self._tag_digests, default=_encode_digest).decode())
 
     def dumps(self):
         """
@@ -293,4 +336,17 @@ class ImageDigestCache(object):
         :return: JSON string.
         :rtype: str
         """
-        return json.dumps(self._serialize(), **DUMP_KWARGS)
+        if orjson is None:
+            return json.dumps(self._tag_digests, **DUMP_KWARGS)
+        return orjson.dumps(self._tag_digests, default=_encode_digest).decode()
+
+    def dumpb(self):
+        """
+        Same as ``dumps``, but returns UTF-8 encoded bytes. This avoids decoding the output of ``orjson``, if installed.
+
+        :return: JSON-encoded bytes.
+        :rtype: bytes
+        """
+        if orjson is None:
+            return json.dumps(self._tag_digests, **DUMP_KWARGS).encode()
+        return orjson.dumps(self._tag_digests, default=_encode_digest)
@@ -5,14 +5,17 @@ import json
 import logging
 import os
 import re
+import sys
+from functools import lru_cache
 
 from requests.auth import AuthBase, HTTPBasicAuth, HTTPDigestAuth
 
-from .client import DockerRegistryClient
-from .query import DockerRegistryQuery
-from .remover import DockerRegistryRemover
+from .client import POOL_MAXSIZE, DockerRegistryClient
+from .query import MAX_WORKERS, DockerRegistryQuery
+from .remover import DockerRegistryRemover, RemovalError
 
 RE_REPLACE_PATTERN = re.compile('(?:.+//)(.*)')
+CACHE_NAME_TRANSLATION = str.maketrans('/.', '__')
 DOCKER_CONFIG_FILE = os.path.expanduser('~/.docker/config.json')
 
 
@@ -22,10 +25,24 @@ def value_or_false(value):
     return value
 
 
-def _get_cache_name(registry):
-    if args.cache is None:
-        return '{0}_cache.json'.format(RE_REPLACE_PATTERN.sub(r'\1', registry).replace('/', '_').replace('.', '_'))
-    return value_or_false(args.cache)
+def positive_int(value):
+    try:
+        int_value = int(value)
+    except ValueError:
+        int_value = 0
+    if int_value < 1:
+        raise argparse.ArgumentTypeError("Expected a positive number, found '{0}'.".format(value))
+    return int_value
+
+
+@lru_cache(maxsize=None)
+def _get_cache_name(registry, cache_arg):
+    if cache_arg is None:
+        registry_match = RE_REPLACE_PATTERN.match(registry)
+        if registry_match:
+            registry = registry_match.group(1)
+        return '{0}_cache.json'.format(registry.translate(CACHE_NAME_TRANSLATION))
+    return value_or_false(cache_arg)
 
 
 def _get_auth_config(registry):
@@ -71,38 +88,35 @@ def _get_query():
             kwargs['cert'] = args.client_cert
     if args.use_get_manifest:
         kwargs['use_get_manifest'] = True
+    if args.workers > POOL_MAXSIZE:
+        kwargs['pool_maxsize'] = args.workers
 
     client = DockerRegistryClient(base_url, **kwargs)
-    query = DockerRegistryQuery(client)
-    cache_fn = _get_cache_name(registry)
+    query = DockerRegistryQuery(client, max_workers=args.workers)
+    cache_fn = _get_cache_name(registry, args.cache)
     if cache_fn and os.path.isfile(cache_fn) and not args.refresh:
-        with open(cache_fn) as f:
+        with open(cache_fn, 'rb') as f:
             query.load(f)
-    return query
+        return query, True
+    return query, False
 
 
 def _save_query(query):
-    cache_fn = _get_cache_name(args.registry)
+    cache_fn = _get_cache_name(args.registry, args.cache)
     if cache_fn:
-        with open(cache_fn, 'w') as f:
-            query.dump(f)
+        with open(cache_fn, 'wb') as f:
+            f.write(query.dumpb())
 
 
 def _get_tag_args():
     if not (args.tags or args.regex):
         parser.error("No tags specified.")
-    if args.tags:
-        tag_list = args.tags[:]
-    else:
-        tag_list = []
+    tag_list = args.tags or []
     if args.regex:
-        tag_list.extend([re.compile(exp) for exp in args.regex])
-    if args.exclude:
-        exclude_list = args.exclude[:]
-    else:
-        exclude_list = []
+        tag_list = tag_list + [re.compile(exp) for exp in args.regex]
+    exclude_list = args.exclude or []
     if args.exclude_regex:
-        exclude_list.extend([re.compile(exp) for exp in args.exclude_regex])
+        exclude_list = exclude_list + [re.compile(exp) for exp in args.exclude_regex]
     return {
         'tags': tag_list,
         'exclude_tags': exclude_list,
@@ -112,10 +126,10 @@ def _get_tag_args():
     }
 
 
-def _show_count(item_type, res):
+def _show_count(item_type, count):
     if not args.count:
         return
-    status_str = "Number of {0}: {1}".format(item_type, len(res))
+    status_str = "Number of {0}: {1}".format(item_type, count)
     sep_str = '-' * len(status_str)
     print(sep_str)
     print(status_str)
@@ -141,10 +155,10 @@ class HTTPBase64Auth(AuthBase):
 
 
 def list_repo_names(query):
-    result = query.get_repo_names()
-    for repo in result:
+    count = 0
+    for count, repo in enumerate(query.iter_repo_names(), 1):
         print(repo)
-    _show_count('repositories', result)
+    _show_count('repositories', count)
 
 
 def list_tag_names(query):
@@ -156,7 +170,7 @@ def list_tag_names(query):
         repo_len = max(len(r[0]) for r in result)
         for repo, tag_name in result:
             print('{0:{1}}  {2}'.format(repo, repo_len, tag_name))
-    _show_count('tags', result)
+    _show_count('tags', len(result))
 
 
 def query_repos(query):
@@ -164,7 +178,7 @@ def query_repos(query):
     result = query.select_repositories(args.repo, raise_intersecting_repo=args.raise_intersecting_repo)
     for repo, digest in result:
         print('{0:{1}}  {2}'.format(repo, repo_len, digest))
-    _show_count('selected digests', result)
+    _show_count('selected digests', len(result))
 
 
 def query_tags(query):
@@ -172,21 +186,32 @@ def query_tags(query):
     result = query.select_tags(args.repo, **_get_tag_args())
     for repo, digest in result:
         print('{0:{1}}  {2}'.format(repo, repo_len, digest))
-    _show_count('selected digests', result)
+    _show_count('selected digests', len(result))
+
+
+def _show_removal(remove, *args, **kwargs):
+    try:
+        result = remove(*args, **kwargs)
+    except RemovalError as e:
+        # Failures have been logged already. The cache still needs to be saved with the successful removals.
+        _show_count('removed digests', len(e.removed_items))
+        _show_count('failed digests', len(e.failed_items))
+        return 1
+    _show_count('removed digests', len(result))
+    return 0
 
 
 def remove_repos(query):
     remover = DockerRegistryRemover(query)
-    result = remover.remove_repositories(args.repo, raise_intersecting_repo=args.raise_intersecting_repo)
-    _show_count('removed digests', result)
+    return _show_removal(remover.remove_repositories, args.repo, max_workers=args.workers,
+                         raise_intersecting_repo=args.raise_intersecting_repo)
 
 
 def remove_tags(query):
     if not (args.tags or args.regex):
         parser.error("No tags specified.")
     remover = DockerRegistryRemover(query)
-    result = remover.remove_tags(args.repo, **_get_tag_args())
-    _show_count('removed digests', result)
+    return _show_removal(remover.remove_tags, args.repo, max_workers=args.workers, **_get_tag_args())
 
 
 parser = argparse.ArgumentParser(description="Lists or removes tags by selection from a Docker Registry.")
@@ -224,6 +249,9 @@ parser.add_argument('--use-get-manifest', action='store_true', default=os.getenv
                     help="Use the HTTP GET method instead of the default HEAD for retrieving content digests. This "
                          "fetches some unused information, but may be required for compatibility with certain "
                          "products, e.g. Nexus Repository.")
+parser.add_argument('--workers', '-w', type=positive_int, default=os.getenv('DOCKER_UTIL_WORKERS', MAX_WORKERS),
+                    help="Maximum number of concurrent requests to the registry. Can also be set using the environment "
+                         "variable DOCKER_UTIL_WORKERS. Default is {0}.".format(MAX_WORKERS))
 parser.add_argument('--log-level', '-l', default='info',
                     help="Output log level.")
 subparsers = parser.add_subparsers(title='command', description="Type of operation to perform.")
@@ -243,10 +271,10 @@ parser_query_tags = subparsers.add_parser('query-tags',
 parser_query_tags.set_defaults(func=query_tags)
 parser_remove_repos = subparsers.add_parser('remove-repos',
                                             help="Deletes all digests of certain repositories from the registry.")
-parser_remove_repos.set_defaults(func=remove_repos)
+parser_remove_repos.set_defaults(func=remove_repos, modifies_cache=True)
 parser_remove_tags = subparsers.add_parser('remove-tags',
                                            help="Deletes all digests that match the given repositories and tags.")
-parser_remove_tags.set_defaults(func=remove_tags)
+parser_remove_tags.set_defaults(func=remove_tags, modifies_cache=True)
 for subparser in [parser_query_repos, parser_query_tags, parser_remove_repos, parser_remove_tags]:
     subparser.add_argument('--repo', '-r', nargs='+', required=True,
                            help="Repository names.")
@@ -287,6 +315,17 @@ def main():
     logging.basicConfig(format='%(asctime)s [%(levelname)s] %(name)s - %(message)s', level=args.log_level.upper())
     logging.getLogger('requests').setLevel(logging.WARNING)
 
-    q = _get_query()
-    args.func(q)
-    _save_query(q)
+    q, cache_loaded = _get_query()
+    modifies_cache = getattr(args, 'modifies_cache', False)
+    try:
+        exit_code = args.func(q)
+    except BaseException:
+        # Keeps removals that were completed before the error. A cache that was not fully loaded is not written.
+        if cache_loaded and modifies_cache:
+            _save_query(q)
+        raise
+    # An unchanged cache file does not need to be written again.
+    if not cache_loaded or modifies_cache:
+        _save_query(q)
+    if exit_code:
+        sys.exit(exit_code)
@@ -1,4 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .digest import ContentDigest
+
+POOL_CONNECTIONS = 32
+POOL_MAXSIZE = 64
+# Retries connection errors and temporary gateway errors. After the last attempt the response is returned, so that
+# raise_for_status() still raises the HTTPError.
+MAX_RETRIES = Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504], raise_on_status=False)
+MAX_WORKERS = 16
+
+
+def _get_page_params(n, last):
+    # Pagination parameters of list endpoints. Without any, the registry decides whether to return all items.
+    params = {}
+    if n is not None:
+        params['n'] = n
+    if last is not None:
+        params['last'] = last
+    return params or None
+
+
+def _get_reference(reference):
+    # Digests can be passed directly, using their cached string representation.
+    if isinstance(reference, ContentDigest):
+        return reference.as_sha256()
+    return reference
 
 
 class DockerRegistryClient(object):
@@ -10,33 +41,45 @@ class DockerRegistryClient(object):
     For more detailed information on the client functions and response contents, refer to the
     [Docker Registry API docs](https://docs.docker.com/registry/spec/api/).
 
+    Manifest and blob references can be given as strings or as :class:`docker_registry_util.digest.ContentDigest`.
+
     :param base_url: Base URL to the Docker Registry, excluding the ``v2`` path. E.g. if your registry is
       ``registry.example.com``, the base URL should be ``https://registry.example.com``.
     :type base_url: str
     :param use_get_manifest: In case of a HEAD request on manifests, uses a GET request instead for compatibility
       with some servers.
+    :param pool_maxsize: Maximum number of connections kept open to the registry. This should be at least the number
+      of threads performing concurrent requests.
+    :type pool_maxsize: int
     :param kwargs: Additional keyword arguments (e.g. for authentication), which are set as attributes on to
       the :class:`requests.Session` instance.
     """
-    def __init__(self, base_url, use_get_manifest=False, **kwargs):
+    def __init__(self, base_url, use_get_manifest=False, pool_maxsize=POOL_MAXSIZE, **kwargs):
         self._base_url = base_url
         self._session = requests.Session()
         self._session.headers = {
             'Accept': 'application/vnd.docker.distribution.manifest.v2+json',
+            'Accept-Encoding': 'gzip',
         }
+        adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=pool_maxsize, max_retries=MAX_RETRIES)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
         if use_get_manifest:
             self._head_manifest_method = 'GET'
         else:
             self._head_manifest_method = 'HEAD'
         for k, v in kwargs.items():
             setattr(self._session, k, v)
+        self._session_request = self._session.request
 
-    def _request(self, method, *args, **kwargs):
-        request_url = '{0}/v2/{1}'.format(self._base_url, '/'.join(args))
-        res = self._session.request(method, request_url, **kwargs)
+    def _request_url(self, method, request_url, **kwargs):
+        res = self._session_request(method, request_url, **kwargs)
         res.raise_for_status()
         return res
 
+    def _request(self, method, *args, **kwargs):
+        return self._request_url(method, self._base_url + '/v2/' + '/'.join(args), **kwargs)
+
     @property
     def base_url(self):
         """
@@ -64,26 +107,60 @@ class DockerRegistryClient(object):
     def ping(self):
         return self._request('GET', '')
 
-    def get_catalog(self):
-        return self._request('GET', '_catalog')
+    def get_catalog(self, n=None, last=None):
+        return self._request('GET', '_catalog', params=_get_page_params(n, last))
 
-    def get_tags(self, name):
-        return self._request('GET', name, 'tags', 'list')
+    def get_tags(self, name, n=None, last=None):
+        return self._request('GET', name, 'tags', 'list', params=_get_page_params(n, last))
+
+    def get_page(self, url):
+        """
+        Retrieves the next page of a list, e.g. of :meth:`get_catalog` or :meth:`get_tags`.
+
+        :param url: URL from the ``next`` link of the previous response, i.e. ``response.links['next']['url']``. It
+          may be relative to the registry.
+        :type url: str
+        :return: Response with the next page.
+        :rtype: requests.Response
+        :raises ValueError: If the URL points to a different scheme or host than the registry, which would receive the
+          session credentials.
+        """
+        request_url = urljoin(self._base_url + '/', url)
+        if urlsplit(request_url)[:2] != urlsplit(self._base_url)[:2]:
+            raise ValueError("Link to the next page does not point to the registry.", url)
+        return self._request_url('GET', request_url)
 
     def get_manifest(self, name, reference):
-        return self._request('GET', name, 'manifests', reference)
+        return self._request('GET', name, 'manifests', _get_reference(reference))
 
     def head_manifest(self, name, reference):
-        return self._request(self._head_manifest_method, name, 'manifests', reference)
+        return self._request(self._head_manifest_method, name, 'manifests', _get_reference(reference))
+
+    def head_manifests(self, name, references, max_workers=MAX_WORKERS):
+        """
+        Same as :meth:`head_manifest`, but performs the requests for multiple references of a repository concurrently.
+        The session is shared between the worker threads, so ``max_workers`` should not exceed the connection pool size.
+
+        :param name: Repository name.
+        :type name: str
+        :param references: Tags or digests.
+        :type references: collections.Iterable[str | docker_registry_util.digest.ContentDigest]
+        :param max_workers: Maximum number of concurrent requests.
+        :type max_workers: int
+        :return: List of responses, in the order of ``references``.
+        :rtype: list[requests.Response]
+        """
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda reference: self.head_manifest(name, reference), references))
 
     def put_manifest(self, name, reference):
-        return self._request('PUT', name, 'manifests', reference)
+        return self._request('PUT', name, 'manifests', _get_reference(reference))
 
     def delete_manifest(self, name, reference):
-        return self._request('DELETE', name, 'manifests', reference)
+        return self._request('DELETE', name, 'manifests', _get_reference(reference))
 
     def get_blob(self, name, digest):
-        return self._request('GET', name, 'blobs', digest)
+        return self._request('GET', name, 'blobs', _get_reference(digest))
 
     def delete_blob(self, name, digest):
-        return self._request('DELETE', name, 'blobs', digest)
+        return self._request('DELETE', name, 'blobs', _get_reference(digest))
@@ -1,12 +1,4 @@
-import codecs
-
-codec_info = codecs.lookup('hex')
-_encode_hex = codec_info.encode
-_decode_hex = codec_info.decode
-
-
-def _encode_hex_str(value):
-    return _encode_hex(value)[0].decode()
+from binascii import hexlify, unhexlify
 
 
 class ContentDigest(bytes):
@@ -14,10 +6,19 @@ class ContentDigest(bytes):
     def from_sha256(cls, value):
         if value[:7] != 'sha256:':
             raise ValueError("Found unsupported digest type.", value)
-        return cls(_decode_hex(value[7:])[0])
+        digest = cls(unhexlify(value[7:]))
+        # Encoded digests should be lowercase hexadecimal, so that the original string can usually be reused. Others are
+        # formatted on demand, so that equal digests have the same representation.
+        if value.islower():
+            digest._sha256 = value
+        return digest
 
     def as_sha256(self):
-        return 'sha256:{0}'.format(_encode_hex_str(self))
+        try:
+            return self._sha256
+        except AttributeError:
+            sha256 = self._sha256 = 'sha256:' + hexlify(self).decode()
+            return sha256
 
     __str__ = as_sha256
 
@@ -1,8 +1,10 @@
 import logging
-from itertools import zip_longest
+import operator
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial, total_ordering
+from itertools import repeat
 
 import re
-from distutils.version import LooseVersion
 
 from .digest import ContentDigest
 from .cache import ImageDigestCache
@@ -17,55 +19,178 @@ def _str_or_list(value):
 
 
 VERSION_REGEX = re.compile('((?:[<>]=?)|(?:==))(.+)')
+VERSION_COMPONENT_REGEX = re.compile(r'(\d+|[a-z]+|\.)')
+VERSION_OPERATORS = {
+    '==': operator.eq,
+    '>': operator.gt,
+    '<': operator.lt,
+    '>=': operator.ge,
+    '<=': operator.le,
+}
+VERSION_PREFIXES = frozenset('<>=')
 REGEX_TYPE = type(VERSION_REGEX)
 
 log = logging.getLogger(__name__)
 
+MAX_WORKERS = 32
+PAGE_SIZE = 1000
+
+
+@lru_cache(maxsize=4096)
+def _parse_version(value):
+    # Same components as distutils' LooseVersion: Numbers are compared as integers, anything else as strings.
+    components = []
+    for component in VERSION_COMPONENT_REGEX.split(value):
+        if component and component != '.':
+            try:
+                components.append(int(component))
+            except ValueError:
+                components.append(component)
+    return tuple(components)
+
+
+@lru_cache(maxsize=4096)
+def _version_sort_key(value):
+    # Pairs each version component with its type, so that strings are sorted after numbers in the same position and
+    # the tuple comparison never raises a TypeError.
+    return tuple((isinstance(component, str), component) for component in _parse_version(value))
+
+
+def _get_version_func(compare, version):
+    def _compare_version(tag):
+        try:
+            return compare(_parse_version(tag), version)
+        except TypeError:
+            # Numbers and strings in the same position, e.g. comparing '1.0' and 'latest'.
+            return False
+
+    return _compare_version
+
+
+def _match_version(value):
+    # Most selectors are plain tag names, which can be told apart by their first character without the regex.
+    if value[:1] not in VERSION_PREFIXES:
+        return None
+    return VERSION_REGEX.match(value)
+
+
+@lru_cache(maxsize=1024)
+def _get_str_tag_func(value):
+    vm = _match_version(value)
+    if vm:
+        version_comparison = vm.group(1)
+        compare = VERSION_OPERATORS.get(version_comparison)
+        if compare is None:
+            # Should be excluded by regular expression.
+            raise ValueError("Undefined version comparison.", version_comparison)
+        return _get_version_func(compare, _parse_version(vm.group(2)))
+    return partial(operator.eq, value)
+
 
 def _get_tag_func(value):
     if callable(value):
         return value
     elif isinstance(value, str):
-        vm = VERSION_REGEX.match(value)
-        if vm:
-            version_comparison = vm.group(1)
-            version = LooseVersion(vm.group(2))
-            if version_comparison == '==':
-                return version.__eq__
-            if version_comparison == '>':
-                return version.__lt__
-            elif version_comparison == '<':
-                return version.__gt__
-            elif version_comparison == '>=':
-                return version.__le__
-            elif version_comparison == '<=':
-                return version.__ge__
-            # Should be excluded by regular expression.
-            raise ValueError("Undefined version comparison.", version_comparison)
+        # Strings are hashable and always result in the same function, which can therefore be reused.
+        return _get_str_tag_func(value)
     elif isinstance(value, REGEX_TYPE):
         return value.match
     # Fall back to equality comparison.
-    return value.__eq__
+    return partial(operator.eq, value)
+
+
+def _is_plain_pattern(value):
+    # Flags and numbered backreferences would not be preserved in a combined expression.
+    return isinstance(value.pattern, str) and value.flags == re.UNICODE and not value.groups
 
 
 def _generate_tag_funcs(values):
+    # Returns a tuple of a set of exact tag names, a regular expression combining patterns (or None), and a list of
+    # functions for any other selectors. None if nothing is selected.
     if not values:
-        return []
+        return None
     if callable(values) or isinstance(values, (str, int, REGEX_TYPE)):
-        return [_get_tag_func(values)]
-    return [_get_tag_func(value) for value in values]
-
-
-def _any_tag_matches(func_list, tag):
-    for func in func_list:
+        values = [values]
+    names = set()
+    patterns = []
+    funcs = []
+    for value in values:
+        if isinstance(value, int):
+            value = str(value)
+        if isinstance(value, str) and not _match_version(value):
+            names.add(value)
+        elif isinstance(value, REGEX_TYPE) and _is_plain_pattern(value):
+            patterns.append(value)
+        else:
+            funcs.append(_get_tag_func(value))
+    if not patterns:
+        regex = None
+    elif len(patterns) == 1:
+        regex = patterns[0]
+    else:
+        regex = re.compile('|'.join('(?:{0})'.format(p.pattern) for p in patterns))
+    return frozenset(names), regex, funcs
+
+
+def _get_single_name(values):
+    # Returns the tag name if the selection consists of exactly one name, and None otherwise.
+    if isinstance(values, (list, tuple)) and len(values) == 1:
+        values = values[0]
+    if isinstance(values, str) and values and not _match_version(values):
+        return values
+    return None
+
+
+def _any_tag_matches(tag_filter, tag):
+    if tag_filter is None or not isinstance(tag, str):
+        return False
+    names, regex, funcs = tag_filter
+    if tag in names:
+        return True
+    if regex is not None and regex.match(tag):
+        return True
+    for func in funcs:
         try:
             if func(tag):
                 return True
         except TypeError:
+            # A selector function that does not apply to the tag is not a match.
             pass
     return False
 
 
+def _unique_digests(repo_digests):
+    # Yields the repository-digest-tuples in their original order, skipping digests that occurred before.
+    seen = set()
+    seen_add = seen.add
+    for repo, digest in repo_digests:
+        if digest not in seen:
+            seen_add(digest)
+            yield repo, digest
+
+
+def _filter_tags(tag_filter, tags):
+    if tag_filter is None:
+        return []
+    names, regex, funcs = tag_filter
+    if not funcs:
+        # Single-part filters can use C functions directly, without calling back into Python for each tag.
+        if regex is None:
+            return list(filter(names.__contains__, tags))
+        if not names:
+            return list(filter(regex.match, tags))
+    return list(filter(partial(_any_tag_matches, tag_filter), tags))
+
+
+def _any_tags_match(tag_filter, tags):
+    names, regex, funcs = tag_filter
+    if not names.isdisjoint(tags):
+        return True
+    if regex is None and not funcs:
+        return False
+    return any(_any_tag_matches(tag_filter, tag) for tag in tags)
+
+
 class IntersectionError(Exception):
     def __init__(self, message, excess_items, digest, *args, **kwargs):
         super(IntersectionError, self).__init__(message, excess_items, digest, *args, **kwargs)
@@ -79,87 +204,146 @@ class IntersectionError(Exception):
         return self.args[2]
 
 
-class SortingVersion(LooseVersion):
+@total_ordering
+class SortingVersion(object):
     """
-    Like LooseVersion, but provides a stable sort order even if different version schemes are used, e.g. numbers and
-    strings occur in even positions. This does not mean that the outcome will be semantically correct. Strings are
-    considered 'higher' than numbers.
+    Like distutils' LooseVersion, but provides a stable sort order even if different version schemes are used, e.g.
+    numbers and strings occur in even positions. This does not mean that the outcome will be semantically correct.
+    Strings are considered 'higher' than numbers.
     """
-    def _cmp(self, other):
-        if self.version == other.version:
-            return 0
-        try:
-            if self.version < other.version:
-                return -1
-            if self.version > other.version:
-                return 1
-        except TypeError:
-            for a, b in zip_longest(self.version, other.version):
-                if a == b:
-                    continue
-                if type(a) == type(b):
-                    if a < b:
-                        return -1
-                    if a > b:
-                        return 1
-                else:
-                    if isinstance(a, str):
-                        return 1
-                    if isinstance(b, str):
-                        return -1
-                    if a is None:
-                        return -1
-                    if b is None:
-                        return 1
+    def __init__(self, vstring):
+        self.vstring = vstring
+        self.version = _parse_version(vstring)
+        self._key = _version_sort_key(vstring)
+
+    def __str__(self):
+        return self.vstring
+
+    def __repr__(self):
+        return "{0}('{1}')".format(self.__class__.__name__, self.vstring)
+
+    def __eq__(self, other):
+        if isinstance(other, str):
+            other = SortingVersion(other)
+        return self._key == other._key
+
+    def __lt__(self, other):
+        if isinstance(other, str):
+            other = SortingVersion(other)
+        return self._key < other._key
 
 
 class DockerRegistryQuery(object):
-    def __init__(self, client):
+    """
+    Queries on repositories, tags, and digests of the Docker Registry, using a local cache.
+
+    :param client: Docker Registry API client.
+    :type client: docker_registry_util.client.DockerRegistryClient
+    :param max_workers: Maximum number of concurrent registry requests while loading tags and digests. Connections are
+     reused from the client's pool, so this should not exceed its ``pool_maxsize``.
+    :type max_workers: int
+    """
+    def __init__(self, client, max_workers=MAX_WORKERS):
         self._client = client
         self._cache = ImageDigestCache()
         self._initialized = False
+        self._max_workers = max_workers
 
     @property
     def client(self):
         return self._client
 
+    def _get_pages(self, get_first_page, key, *args):
+        # Follows the next links of list endpoints. Some registries use opaque values in the links, so they are not
+        # built from the last item. Stops if the registry returns the previous page again, or links a page that has
+        # been requested before.
+        items = []
+        requested_urls = set()
+        res = get_first_page(*args, n=PAGE_SIZE)
+        while True:
+            page = res.json()[key]
+            if not page:
+                break
+            if items and page[-1] == items[-1]:
+                log.warning("Registry returned the same page again, stopping at %s items.", len(items))
+                break
+            items.extend(page)
+            next_link = res.links.get('next')
+            if not next_link:
+                break
+            url = next_link['url']
+            if url in requested_urls:
+                log.warning("Registry returned a link to a previous page, stopping at %s items.", len(items))
+                break
+            requested_urls.add(url)
+            res = self._client.get_page(url)
+        return items
+
+    def _get_tags(self, repo):
+        return self._get_pages(self._client.get_tags, 'tags', repo)
+
+    def _get_digest(self, repo_tag):
+        repo, tag = repo_tag
+        try:
+            manifest = self._client.head_manifest(repo, tag)
+        except IOError as e:
+            # Exceptions from requests derive from IOError. Tags may have been removed since they were listed. Any other
+            # error is raised, as an incomplete cache could miss intersections of selected digests.
+            response = getattr(e, 'response', None)
+            if response is None or response.status_code != 404:
+                raise
+            log.warning("Digest for %s:%s not found - %s", repo, tag, e)
+            return None
+        return ContentDigest.from_sha256(manifest.headers['Docker-Content-Digest'])
+
+    def _get_repo_tags(self, executor, repos):
+        repo_tags = []
+        for repo, tags in zip(repos, executor.map(self._get_tags, repos)):
+            if tags:
+                log.info("Found %s tags in repository '%s'.", len(tags), repo)
+                repo_tags.append((repo, tags))
+            else:
+                log.info("No tags found for '%s', skipping.", repo)
+        return repo_tags
+
+    def _get_digests(self, executor, repo_tags):
+        # Requests are run concurrently, but the cache is only updated by the calling thread.
+        log_debug = log.isEnabledFor(logging.DEBUG)
+        for (repo, tag), digest in zip(repo_tags, executor.map(self._get_digest, repo_tags)):
+            if digest is not None:
+                if log_debug:
+                    log.debug("Registering digest for %s:%s - %s.", repo, tag, digest)
+                yield repo, tag, digest
+
     def refresh(self):
         log.info("Initializing cache.")
         if self._initialized:
             log.info("Clearing.")
             self._cache.reset()
-        repos = self._client.get_catalog().json()['repositories']
+        repos = self._get_pages(self._client.get_catalog, 'repositories')
         log.info("Found %s repositories.", len(repos))
-        for repo in repos:
-            log.info("Checking repository '%s'.", repo)
-            tags = self._client.get_tags(repo).json()['tags']
-            if not tags:
-                log.info("No tags found for '%s', skipping.", repo)
-                continue
-            for tag in tags:
-                manifest = self._client.head_manifest(repo, tag)
-                digest = manifest.headers['Docker-Content-Digest']
-                log.debug("Registering digest for %s:%s - %s.", repo, tag, digest)
-                self._cache.add_image(repo, tag, ContentDigest.from_sha256(digest))
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            image_tags = [(repo, tag)
+                          for repo, tags in self._get_repo_tags(executor, repos)
+                          for tag in tags]
+            add_image = self._cache.add_image
+            for repo, tag, digest in self._get_digests(executor, image_tags):
+                add_image(repo, tag, digest)
         log.info("Cache init completed.")
         self._initialized = True
 
     def update(self, repos, tags):
         log.info("Updating cache.")
         tag_funcs = _generate_tag_funcs(tags)
-        for repo in _str_or_list(repos):
-            log.info("Checking repository '%s'.", repo)
-            available_tags = self._client.get_tags(repo).json()['tags']
-            if not available_tags:
-                log.info("No tags found for '%s', skipping.", repo)
-                continue
-            for tag in available_tags:
-                log.info("Checking filter match for %s:%s.", repo, tag)
-                if _any_tag_matches(tag_funcs, tag):
-                    manifest = self._client.head_manifest(repo, tag)
-                    digest = manifest.headers['Docker-Content-Digest']
-                    log.debug("Registering digest for %s:%s - %s.", repo, tag, digest)
-                    self._cache.update_image(repo, tag, ContentDigest.from_sha256(digest))
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            image_tags = []
+            for repo, available_tags in self._get_repo_tags(executor, _str_or_list(repos)):
+                matched_tags = _filter_tags(tag_funcs, available_tags)
+                log.debug("Matched %s of %s tags in repository '%s'.", len(matched_tags), len(available_tags), repo)
+                image_tags.extend(zip(repeat(repo), matched_tags))
+            update_image = self._cache.update_image
+            for repo, tag, digest in self._get_digests(executor, image_tags):
+                update_image(repo, tag, digest)
 
     def select_repositories(self, names, raise_intersecting_repo=True):
         """
@@ -179,10 +363,11 @@ class DockerRegistryQuery(object):
             self.refresh()
 
         def _complete_match(d):
-            repos = self._cache.get_digest_repos(d)
-            log.debug("Found repositories %s for digest %s.", repos, d)
-            external_names = repos.difference(name_list)
-            log.debug("Outside of query: %s", external_names)
+            repos = get_digest_repos(d)
+            external_names = repos - name_set
+            if log_debug:
+                log.debug("Found repositories %s for digest %s.", repos, d)
+                log.debug("Outside of query: %s", external_names)
             if not external_names:
                 return True
             elif raise_intersecting_repo:
@@ -191,11 +376,16 @@ class DockerRegistryQuery(object):
             return False
 
         name_list = _str_or_list(names)
-        tested_digests = set()
+        name_set = frozenset(name_list)
+        log_debug = log.isEnabledFor(logging.DEBUG)
+        get_digests = self._cache.get_digests
+        get_digest_repos = self._cache.get_digest_repos
+        repo_digests = ((name, digest)
+                        for name in name_list
+                        for digest in get_digests(name))
         return [(name, digest)
-                for name in name_list
-                for digest in self._cache.get_digests(name)
-                if not (digest in tested_digests or tested_digests.add(digest)) and _complete_match(digest)]
+                for name, digest in _unique_digests(repo_digests)
+                if _complete_match(digest)]
 
     def select_tags(self, repos, tags, exclude_tags=None, match_all_tags=True,
                     raise_intersecting_repo=True, raise_intersecting_tag=False):
@@ -226,52 +416,60 @@ class DockerRegistryQuery(object):
         :rtype: list[(str, docker_registry_util.digest.ContentDigest)]
         """
         def _complete_match(d):
-            for repo_name, repo_tags in self._cache.get_grouped_tags(d):
-                tag_set = tag_sets.get(repo_name)
-                if tag_set:
-                    current_tags = {i[1] for i in repo_tags}
-                    if match_all_tags:
-                        external_tags = current_tags - tag_set
-                        if not external_tags:
-                            if any((_any_tag_matches(excluded_filter, t) for t in current_tags)):
-                                return False
-                        elif raise_intersecting_tag:
-                            raise IntersectionError(
-                                "Selected tags intersect with other tags of the repositories, which were not "
-                                "included in the selection.", external_tags, d)
-                        else:
-                            return False
-                    else:
-                        return not any((_any_tag_matches(excluded_filter, t) for t in current_tags))
-                elif raise_intersecting_repo:
+            # Groups are in no particular order, so each check is applied to all repositories before the next one.
+            # Where multiple repositories conflict, the first one by name is reported.
+            repo_tags = {repo_name: set(tag_list) for repo_name, tag_list in get_grouped_tags(d)}
+            external_repos = [repo_name for repo_name in repo_tags if not tag_sets.get(repo_name)]
+            if external_repos:
+                if raise_intersecting_repo:
                     raise IntersectionError(
                         "Selected repositories and tags intersect with at least one other repository "
-                        "or tags within, that is not included.", repo_name, d)
-                else:
+                        "or tags within, that is not included.", min(external_repos), d)
+                return False
+            if match_all_tags:
+                external_tag_repos = [repo_name for repo_name, current_tags in repo_tags.items()
+                                      if not current_tags <= tag_sets[repo_name]]
+                if external_tag_repos:
+                    if raise_intersecting_tag:
+                        repo_name = min(external_tag_repos)
+                        raise IntersectionError(
+                            "Selected tags intersect with other tags of the repositories, which were not "
+                            "included in the selection.", repo_tags[repo_name] - tag_sets[repo_name], d)
                     return False
-            return True
+            return not (has_excludes and any(_any_tags_match(excluded_filter, current_tags)
+                                             for current_tags in repo_tags.values()))
 
         if not self._initialized:
             self.refresh()
-        included_filter = _generate_tag_funcs(tags)
         excluded_filter = _generate_tag_funcs(exclude_tags)
-        tag_sets = dict()
-        test_digests = []
-        for repo in _str_or_list(repos):
-            tag_digests = self._cache.get_tag_digests(repo)
-            if not tag_digests:
-                continue
-            partial_matches = [(tag, digest)
-                               for tag, digest in tag_digests.items()
-                               if _any_tag_matches(included_filter, tag)]
-            if partial_matches:
-                p_tags, p_digests = zip(*partial_matches)
-                tag_sets[repo] = set(p_tags)
-                test_digests.extend([(repo, digest) for digest in p_digests])
-        tested_digests = set()
+        has_excludes = excluded_filter is not None
+        get_tag_digests = self._cache.get_tag_digests
+        get_grouped_tags = self._cache.get_grouped_tags
+        repo_list = _str_or_list(repos)
+        single_tag = _get_single_name(tags) if len(repo_list) == 1 and not has_excludes else None
+        if single_tag is not None:
+            # A single tag name can be looked up directly, instead of testing each tag of the repository.
+            repo = repo_list[0]
+            digest = (get_tag_digests(repo) or {}).get(single_tag)
+            if digest is None:
+                return []
+            tag_sets = {repo: frozenset((single_tag, ))}
+            test_digests = [(repo, digest)]
+        else:
+            included_filter = _generate_tag_funcs(tags)
+            tag_sets = dict()
+            test_digests = []
+            for repo in repo_list:
+                tag_digests = get_tag_digests(repo)
+                if not tag_digests:
+                    continue
+                matched_tags = _filter_tags(included_filter, tag_digests)
+                if matched_tags:
+                    tag_sets[repo] = frozenset(matched_tags)
+                    test_digests.extend(zip(repeat(repo), map(tag_digests.__getitem__, matched_tags)))
         return [(name, digest)
-                for name, digest in test_digests
-                if not (digest in tested_digests or tested_digests.add(digest)) and _complete_match(digest)]
+                for name, digest in _unique_digests(test_digests)
+                if _complete_match(digest)]
 
     def get_repo_names(self):
         """
@@ -284,6 +482,19 @@ class DockerRegistryQuery(object):
             self.refresh()
         return self._cache.get_repo_names()
 
+    def iter_repo_names(self, sort=True):
+        """
+        Returns an iterator over available repository names.
+
+        :param sort: Whether to return the names in sorted order.
+        :type sort: bool
+        :return: Repository name iterator.
+        :rtype: collections.Iterator[str]
+        """
+        if not self._initialized:
+            self.refresh()
+        return self._cache.iter_repo_names(sort)
+
     def get_tag_names(self, repos=None, reverse_sort=False):
         """
         Returns a sorted list of available tags, optionally filtered by a set of repository names.
@@ -301,7 +512,7 @@ class DockerRegistryQuery(object):
             repo_list = _str_or_list(repos)
         else:
             repo_list = None
-        return self._cache.get_tag_names(repo_list, SortingVersion, reverse_sort)
+        return self._cache.get_tag_names(repo_list, _version_sort_key, reverse_sort)
 
     @property
     def cache(self):
@@ -336,8 +547,8 @@ class DockerRegistryQuery(object):
         """
         Loads a previous state of a cache from a JSON string.
 
-        :param s: JSON-formatted string.
-        :type s: str
+        :param s: JSON-formatted string or bytes.
+        :type s: str | bytes
         """
         self._cache = ImageDigestCache.loads(s)
         self._initialized = True
@@ -346,7 +557,7 @@ class DockerRegistryQuery(object):
         """
         Saves the current state of the image cache to a file (or file-like object) in JSON format.
 
-        :param file: Output file.
+        :param file: Output file, opened in text mode. For binary files, write the output of ``dumpb`` instead.
         """
         self._cache.dump(file)
 
@@ -357,3 +568,11 @@ class DockerRegistryQuery(object):
         :return: str
         """
         return self._cache.dumps()
+
+    def dumpb(self):
+        """
+        Returns the current state of the image cache as UTF-8 encoded bytes in JSON format.
+
+        :return: bytes
+        """
+        return self._cache.dumpb()
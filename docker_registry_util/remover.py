@@ -1,8 +1,30 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
 log = logging.getLogger(__name__)
 
+MAX_WORKERS = 16
+PROGRESS_INTERVAL = 100
+
+
+def _is_not_found(e):
+    response = getattr(e, 'response', None)
+    return response is not None and response.status_code == 404
+
+
+class RemovalError(Exception):
+    def __init__(self, message, failed_items, removed_items, *args, **kwargs):
+        super(RemovalError, self).__init__(message, failed_items, removed_items, *args, **kwargs)
+
+    @property
+    def failed_items(self):
+        return self.args[1]
+
+    @property
+    def removed_items(self):
+        return self.args[2]
+
 
 class DockerRegistryRemover(object):
     """
@@ -14,29 +36,79 @@ class DockerRegistryRemover(object):
     def __init__(self, query):
         self._query = query
 
-    def remove_repositories(self, names, **kwargs):
+    def _execute_removal(self, repo_digests, max_workers):
+        # Deletes are run concurrently. Failed requests are logged, and only successful deletions are removed from the
+        # cache. The repository-digest-tuples are iterated only once, while submitting the requests.
+        client = self._query.client
+        log_debug = log.isEnabledFor(logging.DEBUG)
+        futures = {}
+        deleted = set()
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            for name, digest in repo_digests:
+                if log_debug:
+                    log.debug("Removing digest %s.", digest)
+                futures[executor.submit(client.delete_manifest, name, digest)] = name, digest
+            total = len(futures)
+            for completed, future in enumerate(as_completed(futures), 1):
+                if completed % PROGRESS_INTERVAL == 0:
+                    log.info("Processed %s of %s digests.", completed, total)
+                digest = futures[future][1]
+                try:
+                    future.result()
+                except IOError as e:
+                    # Exceptions from requests derive from IOError. A manifest that is not found has been removed
+                    # already, e.g. by a request that was retried after a gateway error, or by another client.
+                    if _is_not_found(e):
+                        log.warning("Digest %s was not found, it may have been removed before - %s", digest, e)
+                        deleted.add(digest)
+                    else:
+                        log.error("Failed to remove digest %s - %s", digest, e)
+                else:
+                    deleted.add(digest)
+        except BaseException:
+            # Requests that have not started yet are cancelled. Any that were already running are waited for, so that
+            # their outcome is known before updating the cache.
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=True)
+            for future, (name, digest) in futures.items():
+                if not future.cancelled():
+                    e = future.exception()
+                    if e is None or (isinstance(e, IOError) and _is_not_found(e)):
+                        deleted.add(digest)
+            raise
+        finally:
+            executor.shutdown(wait=True)
+            # Also applied if the process is interrupted, so that the cache reflects the deletions up to that point.
+            self._query.cache.remove_digests(deleted)
+        log.info("Deleted %s digests.", len(deleted))
+        # Futures are in the order of submission.
+        removed = [repo_digest for repo_digest in futures.values() if repo_digest[1] in deleted]
+        if len(removed) < len(futures):
+            failed = [repo_digest for repo_digest in futures.values() if repo_digest[1] not in deleted]
+            raise RemovalError("Failed to remove {0} of {1} digests.".format(len(failed), len(futures)),
+                               failed, removed)
+        return removed
+
+    def remove_repositories(self, names, max_workers=MAX_WORKERS, **kwargs):
         """
         Removes all digests used by the given repositories, i.e. any of its tags.
 
         :param names: Repository name or a list of multiple repository names.
         :type names: str | list[str]
+        :param max_workers: Maximum number of concurrent delete requests. Connections are reused from the client's pool,
+         so this should not exceed its ``pool_maxsize``.
+        :type max_workers: int
         :param kwargs: Additional kwargs for :meth:`docker_registry_util.query.DockerRegistryQuery.select_repositories`.
-        :return: A list of tuples, each with repository name and digest. If a digest is referred to by multiple
-         repositories, only the first one (in the order of ``names``) is listed.
+        :return: A list of tuples, each with repository name and digest of the removed items. If a digest is referred to
+         by multiple repositories, only the first one (in the order of ``names``) is listed.
         :rtype: list[(str, docker_registry_util.digest.ContentDigest)]
+        :raises RemovalError: If any of the digests could not be removed. The remaining ones are removed nonetheless.
         """
-        client = self._query.client
-        cache = self._query.cache
-        repo_digests = self._query.select_repositories(names, **kwargs)
-        for name, digest in repo_digests:
-            log.info("Removing digest %s.", digest)
-            client.delete_manifest(name, digest.as_sha256())
-        digests_only = [i[1] for i in repo_digests]
-        cache.remove_digests(digests_only)
-        log.info("Deleted %s digests.", len(repo_digests))
-        return repo_digests
-
-    def remove_tags(self, repos, tags, **kwargs):
+        return self._execute_removal(self._query.select_repositories(names, **kwargs), max_workers)
+
+    def remove_tags(self, repos, tags, max_workers=MAX_WORKERS, **kwargs):
         """
         Removes all digests used by the given repositories and their tags matching the given selectors.
 
@@ -44,18 +116,13 @@ class DockerRegistryRemover(object):
         :type repos: str | list[str]
         :param tags: Single tag name or list of tag names for exact match. Or version selectors, e.g. ``>=1.0.0`` for
          selecting versioned tags. Or compiled regular expressions for performing RegEx matches.
+        :param max_workers: Maximum number of concurrent delete requests. Connections are reused from the client's pool,
+         so this should not exceed its ``pool_maxsize``.
+        :type max_workers: int
         :param kwargs: Additional kwargs for :meth:`docker_registry_util.query.DockerRegistryQuery.select_tags`.
-        :return: A list of tuples, each with repository name and digest. If a digest is referred to by multiple
-         repositories, only the first one (in the order of ``repos``) is listed.
+        :return: A list of tuples, each with repository name and digest of the removed items. If a digest is referred to
+         by multiple repositories, only the first one (in the order of ``repos``) is listed.
         :rtype: list[(str, docker_registry_util.digest.ContentDigest)]
+        :raises RemovalError: If any of the digests could not be removed. The remaining ones are removed nonetheless.
         """
-        client = self._query.client
-        cache = self._query.cache
-        tag_digests = self._query.select_tags(repos, tags, **kwargs)
-        for name, digest in tag_digests:
-            log.info("Removing digest %s.", digest)
-            client.delete_manifest(name, digest.as_sha256())
-        digests_only = [i[1] for i in tag_digests]
-        cache.remove_digests(digests_only)
-        log.info("Deleted %s digests.", len(tag_digests))
-        return tag_digests
+        return self._execute_removal(self._query.select_tags(repos, tags, **kwargs), max_workers)
@@ -24,6 +24,9 @@ setup(
     version=__version__,
     packages=find_packages(),
     install_requires=['setuptools', 'requests'],
+    extras_require={
+        'orjson': ['orjson'],
+    },
     url='https://github.com/merll/docker-registry-util',
     license='MIT',
     author='Matthias Erll',
@@ -1,6 +1,3 @@
-
-from copy import deepcopy
-
 from docker_registry_util.digest import ContentDigest
 from docker_registry_util.cache import ImageDigestCache
 
@@ -53,6 +50,7 @@ TEST_REGISTRY_DIGESTS = {
 
 def get_preset_cache():
     cache = ImageDigestCache()
-    cache._digest_tags = deepcopy(TEST_REGISTRY_DIGESTS)
-    cache._tag_digests = deepcopy(TEST_REGISTRY_TAGS)
+    # Digests and tuples are immutable, only the containers need to be copied.
+    cache._digest_tags = {digest: set(repo_tags) for digest, repo_tags in TEST_REGISTRY_DIGESTS.items()}
+    cache._tag_digests = {repo: dict(tag_digests) for repo, tag_digests in TEST_REGISTRY_TAGS.items()}
     return cache
@@ -1,6 +1,7 @@
+import io
 import os
 import unittest
-from tempfile import mktemp
+from tempfile import SpooledTemporaryFile, mktemp
 
 from test.data import *
 
@@ -15,10 +16,18 @@ class TestCache(unittest.TestCase):
 
     def test_update_tag(self):
         cache = get_preset_cache()
-        cache.update_image('a', 'latest', D_A2)
+        self.assertTrue(cache.update_image('a', 'latest', D_A2))
         self.assertSetEqual(cache.get_digests('a', ['latest']), {D_A2})
         self.assertIn(('a', 'latest'), cache.get_digest_tags(D_A2))
         self.assertNotIn(('a', 'latest'), cache.get_digest_tags(D_A1))
+        self.assertFalse(cache.update_image('a', 'latest', D_A2))
+
+    def test_update_new_image(self):
+        cache = ImageDigestCache()
+        self.assertTrue(cache.update_image('a', 'latest', D_A1))
+        self.assertTrue(cache.update_image('a', '1.1.0', D_A1))
+        self.assertDictEqual(cache.get_tag_digests('a'), {'latest': D_A1, '1.1.0': D_A1})
+        self.assertSetEqual(cache.get_digest_tags(D_A1), {('a', 'latest'), ('a', '1.1.0')})
 
     def test_remove_independent_repo(self):
         cache = get_preset_cache()
@@ -73,10 +82,55 @@ class TestCache(unittest.TestCase):
         self.assertNotIn('b', cache)
         self.assertDictEqual(cache.get_tag_digests('c'), {'1.1.0': D_C, 'testing': D_C})
 
+    def test_remove_multiple_digests(self):
+        cache = get_preset_cache()
+        cache.remove_digests([D_A1, D_BC, D_A1])
+        self.assertNotIn('b', cache)
+        self.assertSetEqual(set(cache.get_tag_digests('a')), {'1.2.0', 'extra', 'testing'})
+        self.assertDictEqual(cache.get_tag_digests('c'), {'1.1.0': D_C, 'testing': D_C})
+        self.assertIsNone(cache.get_digest_tags(D_A1))
+        self.assertIsNone(cache.get_digest_tags(D_BC))
+
+    def test_grouped_tags(self):
+        cache = get_preset_cache()
+        grouped = {repo: set(tags) for repo, tags in cache.get_grouped_tags(D_BC)}
+        self.assertDictEqual(grouped, {'b': {'1.0.0', 'latest'}, 'c': {'1.0.0', 'latest'}})
+        self.assertListEqual(list(cache.get_grouped_tags(ContentDigest(b'00'))), [])
+
+    def test_digests(self):
+        cache = get_preset_cache()
+        self.assertSetEqual(cache.get_digests('a'), {D_A1, D_A2})
+        self.assertSetEqual(cache.get_digests('c', ['1.0.0', 'latest', 'missing']), {D_BC})
+        self.assertSetEqual(cache.get_digests('missing'), set())
+        self.assertSetEqual(cache.get_digests('missing', ['latest']), set())
+
+    def test_repo_names(self):
+        cache = get_preset_cache()
+        self.assertListEqual(cache.get_repo_names(), ['a', 'b', 'c'])
+        self.assertListEqual(list(cache.iter_repo_names()), ['a', 'b', 'c'])
+        self.assertSetEqual(set(cache.iter_repo_names(sort=False)), {'a', 'b', 'c'})
+
+    def test_tag_names(self):
+        cache = get_preset_cache()
+        self.assertListEqual(cache.get_tag_names(['c', 'b']),
+                             [('c', '1.0.0'), ('c', '1.1.0'), ('c', 'latest'), ('c', 'testing'),
+                              ('b', '1.0.0'), ('b', 'latest')])
+        self.assertListEqual(cache.get_tag_names(reverse_sort=True)[:5],
+                             [('a', 'testing'), ('a', 'latest'), ('a', 'extra'), ('a', '1.2.0'), ('a', '1.1.0')])
+        self.assertEqual(len(cache.get_tag_names()), 11)
+
     def test_dumps_loads(self):
         cache = get_preset_cache()
         reloaded = cache.loads(cache.dumps())
         self.assertDictEqual(cache._tag_digests, reloaded._tag_digests)
+        self.assertDictEqual(cache._digest_tags, reloaded._digest_tags)
+
+    def test_loads_uppercase_digest(self):
+        cache = ImageDigestCache.loads('{"a": {"latest": "sha256:ABCD0123"}}')
+        digest = cache.get_tag_digests('a')['latest']
+        self.assertEqual(digest, ContentDigest.from_sha256('sha256:abcd0123'))
+        self.assertEqual(digest.as_sha256(), 'sha256:abcd0123')
+        self.assertEqual(cache.dumps(), '{"a":{"latest":"sha256:abcd0123"}}')
 
     def test_dump_load(self):
         filename = mktemp()
@@ -89,3 +143,18 @@ class TestCache(unittest.TestCase):
         finally:
             os.unlink(filename)
         self.assertDictEqual(cache._tag_digests, reloaded._tag_digests)
+
+    def test_dump_temporary_file(self):
+        cache = get_preset_cache()
+        with SpooledTemporaryFile(mode='w+') as f:
+            cache.dump(f)
+            f.seek(0)
+            reloaded = cache.load(f)
+        self.assertDictEqual(cache._tag_digests, reloaded._tag_digests)
+
+    def test_dump_load_binary(self):
+        cache = get_preset_cache()
+        f = io.BytesIO(cache.dumpb())
+        reloaded = cache.load(f)
+        self.assertDictEqual(cache._tag_digests, reloaded._tag_digests)
+        self.assertDictEqual(cache._digest_tags, reloaded._digest_tags)
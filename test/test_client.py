@@ -0,0 +1,14 @@
+import unittest
+
+from docker_registry_util.client import DockerRegistryClient
+
+
+class ClientTest(unittest.TestCase):
+    def test_page_link_to_other_host(self):
+        client = DockerRegistryClient('https://registry.example.com')
+        with self.assertRaises(ValueError):
+            client.get_page('https://other.example.com/v2/_catalog?n=2&last=b')
+        with self.assertRaises(ValueError):
+            client.get_page('http://registry.example.com/v2/_catalog?n=2&last=b')
+        with self.assertRaises(ValueError):
+            client.get_page('//other.example.com/v2/_catalog?n=2&last=b')
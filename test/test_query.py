@@ -1,13 +1,77 @@
 import re
 import unittest
+from collections import Counter
+from urllib.parse import parse_qs, urlsplit
 
-from docker_registry_util.query import DockerRegistryQuery, IntersectionError
+from docker_registry_util.query import (DockerRegistryQuery, IntersectionError, SortingVersion, _any_tag_matches,
+                                        _filter_tags, _generate_tag_funcs)
 
 from test.data import *
 
 _ALL_TAGS = re.compile('.*')
 
 
+class _Response(object):
+    def __init__(self, data=None, headers=None, links=None):
+        self._data = data
+        self.headers = headers or {}
+        self.links = links or {}
+
+    def json(self):
+        return self._data
+
+
+class _HTTPError(IOError):
+    def __init__(self, status_code):
+        super(_HTTPError, self).__init__("{0} Client Error".format(status_code))
+        self.response = _Response()
+        self.response.status_code = status_code
+
+
+class _RegistryClient(object):
+    def __init__(self, registry_tags, page_size=None):
+        self.registry_tags = registry_tags
+        self.page_size = page_size
+        self.repeat_links = False
+        self.requested_pages = []
+
+    def _get_items(self, path):
+        if path == '_catalog':
+            return 'repositories', sorted(self.registry_tags) + ['empty']
+        name = path[:-len('/tags/list')]
+        return 'tags', sorted(self.registry_tags.get(name) or ())
+
+    def _get_page(self, path, n, start=0):
+        key, items = self._get_items(path)
+        n = min(filter(None, (n, self.page_size)), default=None)
+        if n is not None and len(items) > start + n:
+            # Uses an opaque value for the start of the next page, like some registry implementations.
+            next_start = start if self.repeat_links else start + n
+            url = '/v2/{0}?n={1}&last=page-{2}'.format(path, n, next_start)
+            return _Response({key: items[start:start + n]}, links={'next': {'url': url, 'rel': 'next'}})
+        return _Response({key: items[start:] or None})
+
+    def get_catalog(self, n=None, last=None):
+        return self._get_page('_catalog', n)
+
+    def get_tags(self, name, n=None, last=None):
+        return self._get_page(name + '/tags/list', n)
+
+    def get_page(self, url):
+        self.requested_pages.append(url)
+        parts = urlsplit(url)
+        query = parse_qs(parts.query)
+        return self._get_page(parts.path[len('/v2/'):], int(query['n'][0]), int(query['last'][0][len('page-'):]))
+
+    def head_manifest(self, name, reference):
+        digest = self.registry_tags[name][reference]
+        if digest is None:
+            raise _HTTPError(404)
+        if isinstance(digest, int):
+            raise _HTTPError(digest)
+        return _Response(headers={'Docker-Content-Digest': digest.as_sha256()})
+
+
 class QueryTest(unittest.TestCase):
     def setUp(self):
         self.query = DockerRegistryQuery('localhost')
@@ -15,7 +79,7 @@ class QueryTest(unittest.TestCase):
         self.query._initialized = True
 
     def assertItemsEqual(self, list1, list2, msg=None):
-        return self.assertListEqual(sorted(list1), sorted(list2), msg=msg)
+        return self.assertEqual(Counter(list1), Counter(list2), msg=msg)
 
     def test_independent_repo_selection(self):
         q = self.query.select_repositories
@@ -66,7 +130,126 @@ class QueryTest(unittest.TestCase):
         self.assertSetEqual(ce3.conflicting_items, {'latest'})
         self.assertEqual(ce3.digest, D_BC)
 
+    def test_single_tag_selection(self):
+        q = self.query.select_tags
+        self.assertItemsEqual(q('a', 'extra'), [])
+        self.assertItemsEqual(q(['a'], ['extra'], match_all_tags=False), [('a', D_A2)])
+        self.assertItemsEqual(q('a', 'missing'), [])
+        self.assertItemsEqual(q('missing', 'latest'), [])
+        self.assertItemsEqual(q('a', '1.1.0', match_all_tags=False), [('a', D_A1)])
+        self.assertItemsEqual(q('b', 'latest', raise_intersecting_repo=False), [])
+        with self.assertRaises(IntersectionError) as ie1:
+            q('a', 'latest', raise_intersecting_tag=True)
+        self.assertSetEqual(ie1.exception.conflicting_items, {'1.1.0'})
+        self.assertEqual(ie1.exception.digest, D_A1)
+
+    def test_shared_digest_selection(self):
+        query = DockerRegistryQuery('localhost')
+        for repo, tag in [('x', '1'), ('x', 'old'), ('y', '1'), ('z', '1')]:
+            query.cache.add_image(repo, tag, D_A1)
+        query._initialized = True
+        q = query.select_tags
+        self.assertItemsEqual(q(['x', 'y', 'z'], '1', match_all_tags=False), [('x', D_A1)])
+        self.assertItemsEqual(q(['y', 'z', 'x'], '1', 'old', match_all_tags=False), [])
+        self.assertItemsEqual(q(['y', 'z'], '1', match_all_tags=False, raise_intersecting_repo=False), [])
+        with self.assertRaises(IntersectionError) as ie1:
+            q(['x', 'y', 'z'], '1', raise_intersecting_tag=True)
+        self.assertSetEqual(ie1.exception.conflicting_items, {'old'})
+        with self.assertRaises(IntersectionError) as ie2:
+            q(['x', 'y'], '1', raise_intersecting_tag=True)
+        self.assertEqual(ie2.exception.conflicting_items, 'z')
+        with self.assertRaises(IntersectionError) as ie3:
+            q('z', '1', match_all_tags=False)
+        self.assertEqual(ie3.exception.conflicting_items, 'x')
+
     def test_tag_selection_with_exclusion(self):
         q = self.query.select_tags
         self.assertItemsEqual(q('a', _ALL_TAGS, 'latest'), [('a', D_A2)])
         self.assertItemsEqual(q(['b', 'c'], _ALL_TAGS, ['testing']), [('b', D_BC)])
+
+    def test_tag_names(self):
+        self.assertListEqual(self.query.get_tag_names('a'),
+                             [('a', '1.1.0'), ('a', '1.2.0'), ('a', 'extra'), ('a', 'latest'), ('a', 'testing')])
+        self.assertListEqual(self.query.get_tag_names(['c'], reverse_sort=True),
+                             [('c', 'testing'), ('c', 'latest'), ('c', '1.1.0'), ('c', '1.0.0')])
+
+    def test_sorting_version(self):
+        tags = ['latest', '1.a', '1.0.1', '1', '1.0', '1.10', '1.9']
+        self.assertListEqual(sorted(tags, key=SortingVersion), ['1', '1.0', '1.0.1', '1.9', '1.10', '1.a', 'latest'])
+        self.assertEqual(SortingVersion('1.0'), '1.0')
+        self.assertLess(SortingVersion('1.0'), 'latest')
+
+
+class TagFilterTest(unittest.TestCase):
+    def assertMatches(self, values, tags, expected):
+        tag_filter = _generate_tag_funcs(values)
+        self.assertListEqual([t for t in tags if _any_tag_matches(tag_filter, t)], expected)
+        self.assertListEqual(_filter_tags(tag_filter, tags), expected)
+
+    def test_no_filter(self):
+        self.assertIsNone(_generate_tag_funcs(None))
+        self.assertIsNone(_generate_tag_funcs([]))
+        self.assertFalse(_any_tag_matches(None, 'latest'))
+        self.assertListEqual(_filter_tags(None, ['latest']), [])
+
+    def test_names_and_patterns(self):
+        tags = ['1.0.0', '1.0.0-alpine', '1.1.0', 'latest', 'v1.0', 'LATEST']
+        self.assertMatches('1.0.0', tags, ['1.0.0'])
+        self.assertMatches(['latest', re.compile(r'1\.1')], tags, ['1.1.0', 'latest'])
+        self.assertMatches(['1.0.0', re.compile('latest', re.I)], tags, ['1.0.0', 'latest', 'LATEST'])
+        self.assertMatches([re.compile(r'(\d)\.\1')], ['1.1.0', '1.0.0'], ['1.1.0'])
+        self.assertMatches([re.compile('^v'), re.compile('(?i)rc')], ['v1', 'V1', 'RC1'], ['v1', 'RC1'])
+
+    def test_versions_and_functions(self):
+        tags = ['1.0.0', '1.1.0', '1.1.0-alpine', '2.0', 'latest']
+        self.assertMatches('>1.0.0', tags, ['1.1.0', '1.1.0-alpine', '2.0'])
+        self.assertMatches(['<1.1.0', 'latest'], tags, ['1.0.0', 'latest'])
+        self.assertMatches([lambda t: t.endswith('-alpine'), '==2.0'], tags, ['1.1.0-alpine', '2.0'])
+        self.assertMatches([lambda t: t + 1, 'latest'], tags, ['latest'])
+
+
+class RefreshTest(unittest.TestCase):
+    def setUp(self):
+        self.client = _RegistryClient({repo: dict(tags) for repo, tags in TEST_REGISTRY_TAGS.items()})
+        self.query = DockerRegistryQuery(self.client, max_workers=4)
+
+    def test_refresh(self):
+        self.query.refresh()
+        self.assertDictEqual(self.query.cache._tag_digests, TEST_REGISTRY_TAGS)
+        self.assertDictEqual(self.query.cache._digest_tags, TEST_REGISTRY_DIGESTS)
+        self.assertNotIn('empty', self.query.cache)
+
+    def test_refresh_pages(self):
+        self.client.page_size = 2
+        self.query.refresh()
+        self.assertDictEqual(self.query.cache._tag_digests, TEST_REGISTRY_TAGS)
+        self.assertDictEqual(self.query.cache._digest_tags, TEST_REGISTRY_DIGESTS)
+        self.assertIn('/v2/a/tags/list?n=2&last=page-4', self.client.requested_pages)
+
+    def test_refresh_repeated_pages(self):
+        self.client.page_size = 2
+        self.client.repeat_links = True
+        self.assertListEqual(self.query._get_pages(self.client.get_catalog, 'repositories'), ['a', 'b'])
+        self.query.refresh()
+        self.assertListEqual(self.query.cache.get_repo_names(), ['a', 'b'])
+        self.assertSetEqual(set(self.query.cache.get_tag_digests('a')), {'1.1.0', '1.2.0'})
+
+    def test_refresh_skips_failed_tags(self):
+        self.client.registry_tags['a']['extra'] = None
+        self.query.refresh()
+        self.assertNotIn('extra', self.query.cache.get_tag_digests('a'))
+        self.assertSetEqual(self.query.cache.get_digest_tags(D_A2), {('a', '1.2.0'), ('a', 'testing')})
+
+    def test_refresh_raises_errors(self):
+        self.client.registry_tags['a']['extra'] = 401
+        with self.assertRaises(IOError):
+            self.query.refresh()
+
+    def test_update(self):
+        self.query.refresh()
+        self.client.registry_tags['a']['latest'] = D_A2
+        self.client.registry_tags['c']['latest'] = D_C
+        self.query.update(['a', 'b'], ['latest'])
+        self.assertSetEqual(self.query.cache.get_digests('a', ['latest']), {D_A2})
+        self.assertSetEqual(self.query.cache.get_digests('c', ['latest']), {D_BC})
+        self.assertNotIn(('a', 'latest'), self.query.cache.get_digest_tags(D_A1))
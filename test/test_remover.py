@@ -0,0 +1,104 @@
+import threading
+import unittest
+
+from docker_registry_util.cache import ImageDigestCache
+from docker_registry_util.digest import ContentDigest
+from docker_registry_util.query import DockerRegistryQuery
+from docker_registry_util.remover import DockerRegistryRemover, RemovalError
+
+from test.data import *
+
+
+class _Response(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class _HTTPError(IOError):
+    def __init__(self, status_code):
+        super(_HTTPError, self).__init__("{0} Error".format(status_code))
+        self.response = _Response(status_code)
+
+
+class _RemovingClient(object):
+    def __init__(self, failing_digests=(), missing_digests=()):
+        self.failing_digests = set(failing_digests)
+        self.missing_digests = set(missing_digests)
+        self.deleted = []
+
+    def delete_manifest(self, name, reference):
+        if reference in self.failing_digests:
+            raise _HTTPError(500)
+        if reference in self.missing_digests:
+            raise _HTTPError(404)
+        self.deleted.append((name, reference))
+
+
+class _InterruptedClient(object):
+    def __init__(self):
+        self.deleted = []
+        self._calls = 0
+        self._lock = threading.Lock()
+
+    def delete_manifest(self, name, reference):
+        with self._lock:
+            self._calls += 1
+            first = self._calls == 1
+        if first:
+            raise RuntimeError("Unexpected error.")
+        # Gives the caller time to cancel the remaining requests.
+        threading.Event().wait(0.05)
+        with self._lock:
+            self.deleted.append(reference)
+
+
+class RemoverTest(unittest.TestCase):
+    def setUp(self):
+        self.client = _RemovingClient([D_A2])
+        self.query = DockerRegistryQuery(self.client)
+        self.query._cache = get_preset_cache()
+        self.query._initialized = True
+        self.remover = DockerRegistryRemover(self.query)
+
+    def test_remove_repositories(self):
+        self.assertListEqual(sorted(self.remover.remove_repositories(['c', 'b'], max_workers=2)),
+                             sorted([('c', D_BC), ('c', D_C)]))
+        self.assertListEqual(sorted(self.client.deleted), sorted([('c', D_BC), ('c', D_C)]))
+        self.assertNotIn('b', self.query.cache)
+        self.assertNotIn('c', self.query.cache)
+
+    def test_remove_failed_tags(self):
+        with self.assertRaises(RemovalError) as re1:
+            self.remover.remove_tags('a', ['1.2.0', 'testing', 'extra'])
+        self.assertListEqual(re1.exception.failed_items, [('a', D_A2)])
+        self.assertListEqual(re1.exception.removed_items, [])
+        self.assertListEqual(self.client.deleted, [])
+        self.assertSetEqual(self.query.cache.get_digest_tags(D_A2), TEST_REGISTRY_DIGESTS[D_A2])
+
+    def test_remove_partially_failed(self):
+        with self.assertRaises(RemovalError) as re1:
+            self.remover.remove_repositories('a')
+        self.assertListEqual(re1.exception.failed_items, [('a', D_A2)])
+        self.assertListEqual(re1.exception.removed_items, [('a', D_A1)])
+        self.assertIsNone(self.query.cache.get_digest_tags(D_A1))
+        self.assertSetEqual(self.query.cache.get_digest_tags(D_A2), TEST_REGISTRY_DIGESTS[D_A2])
+
+    def test_remove_missing(self):
+        self.client.failing_digests.clear()
+        self.client.missing_digests.add(D_A2)
+        self.assertListEqual(sorted(self.remover.remove_repositories('a')), sorted([('a', D_A1), ('a', D_A2)]))
+        self.assertListEqual(self.client.deleted, [('a', D_A1)])
+        self.assertNotIn('a', self.query.cache)
+
+    def test_remove_interrupted(self):
+        client = _InterruptedClient()
+        query = DockerRegistryQuery(client)
+        query._cache = ImageDigestCache()
+        digests = {ContentDigest(bytes([i])) for i in range(50)}
+        for i, digest in enumerate(digests):
+            query.cache.add_image('a', str(i), digest)
+        query._initialized = True
+        with self.assertRaises(RuntimeError):
+            DockerRegistryRemover(query).remove_repositories('a', max_workers=1)
+        self.assertLess(len(client.deleted), 49)
+        self.assertSetEqual(query.cache.get_digests('a'), digests - set(client.deleted))